@@ -17,7 +17,7 @@ from xml.etree.ElementTree import Element, SubElement, tostring
 
 from dlhd_proxy.step_daddy import Channel, StepDaddy
 from rxconfig import config
-from .utils import urlsafe_base64_decode
+from .utils import load_key, urlsafe_base64_decode
 
 GUIDE_FILE = Path("guide.xml")
 DATA_DIR = Path(os.getenv("CHANNEL_DATA_DIR", "data"))
@@ -27,6 +27,9 @@ CHANNEL_FILE = Path(
 LEGACY_CHANNEL_FILE = Path("channels.json")
 LOG_FILE = Path("dlhd_proxy.log")
 
+# (path, mtime_ns, size, ids) of the last channel selection read from disk.
+_selection_cache: tuple[Path, int, int, frozenset[str]] | None = None
+
 logging.basicConfig(
     level=logging.INFO,
     format="%(asctime)s [%(levelname)s] %(name)s: %(message)s",
@@ -58,7 +61,9 @@ client = httpx.AsyncClient(
 
 @fastapi_app.on_event("startup")
 async def _startup() -> None:
-    """Ensure we have an initial channel list on boot."""
+    """Ensure we have a token key and an initial channel list on boot."""
+    # Fail fast on a missing/short key file instead of 500ing every stream.
+    load_key()
     if not step_daddy.channels:
         try:
             await step_daddy.load_channels()
@@ -75,11 +80,12 @@ async def _shutdown() -> None:
 
 def _load_channel_file(path: Path) -> set[str] | None:
     """Return the channel IDs stored at *path* or ``None`` on error."""
-    if not path.exists():
-        return None
     try:
-        raw = json.loads(path.read_text())
-    except json.JSONDecodeError:
+        with open(path, "rb", buffering=65536) as fp:
+            raw = json.load(fp)
+    except FileNotFoundError:
+        return None
+    except (json.JSONDecodeError, UnicodeDecodeError):
         logger.warning("Channel selection file %s is not valid JSON", path)
         return None
     except OSError as exc:
@@ -92,16 +98,34 @@ def _load_channel_file(path: Path) -> set[str] | None:
 
 
 def _write_channel_file(path: Path, payload: list[str]) -> None:
-    """Persist the channel IDs to *path*."""
+    """Atomically persist the channel IDs to *path*."""
     path.parent.mkdir(parents=True, exist_ok=True)
-    path.write_text(json.dumps(payload))
+    tmp_path = path.with_name(f"{path.name}.tmp")
+    try:
+        with open(tmp_path, "w", buffering=65536) as fp:
+            json.dump(payload, fp)
+        os.replace(tmp_path, path)
+    except OSError:
+        tmp_path.unlink(missing_ok=True)
+        raise
 
 
 def get_selected_channel_ids() -> set[str]:
     """Return the set of enabled channel IDs."""
+    global _selection_cache
+    try:
+        stat = CHANNEL_FILE.stat()
+    except OSError:
+        stat = None
+    if stat is not None:
+        cached = _selection_cache
+        if cached is not None and cached[:3] == (CHANNEL_FILE, stat.st_mtime_ns, stat.st_size):
+            return set(cached[3])
     for path in (CHANNEL_FILE, LEGACY_CHANNEL_FILE):
         data = _load_channel_file(path)
         if data is not None:
+            if path is CHANNEL_FILE and stat is not None:
+                _selection_cache = (CHANNEL_FILE, stat.st_mtime_ns, stat.st_size, frozenset(data))
             if path is LEGACY_CHANNEL_FILE and not CHANNEL_FILE.exists():
                 try:
                     _write_channel_file(CHANNEL_FILE, sorted(data))
@@ -113,7 +137,9 @@ def get_selected_channel_ids() -> set[str]:
 
 def set_selected_channel_ids(ids: list[str]) -> None:
     """Persist the selected channel IDs and refresh the guide."""
+    global _selection_cache
     cleaned = sorted({str(cid) for cid in ids if cid})
+    _selection_cache = None
     try:
         _write_channel_file(CHANNEL_FILE, cleaned)
     except OSError as exc:
@@ -241,7 +267,7 @@ def get_channel(channel_id: str) -> Channel | None:
     """Return the channel with the given ID if it exists."""
     if not channel_id:
         return None
-    return next((channel for channel in step_daddy.channels if channel.id == channel_id), None)
+    return step_daddy.channel(channel_id)
 
 
 @fastapi_app.get("/playlist.m3u8")
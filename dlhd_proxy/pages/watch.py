@@ -97,20 +97,16 @@ def uri_card() -> rx.Component:
 
 @rx.page("/watch/[channel_id]")
 def watch() -> rx.Component:
-    warning = rx.cond(
-        config.proxy_content,
-        rx.fragment(),
-        rx.card(
-            rx.hstack(
-                rx.icon("info"),
-                rx.text(
-                    "Proxy content is disabled on this instance. Web player may not work due to CORS.",
-                ),
+    warning = rx.fragment() if config.proxy_content else rx.card(
+        rx.hstack(
+            rx.icon("info"),
+            rx.text(
+                "Proxy content is disabled on this instance. Web player may not work due to CORS.",
             ),
-            width="100%",
-            margin_bottom="1rem",
-            background_color=rx.color("accent", 7),
         ),
+        width="100%",
+        margin_bottom="1rem",
+        background_color=rx.color("accent", 7),
     )
 
     channel_header = rx.hstack(
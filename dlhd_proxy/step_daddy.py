@@ -1,13 +1,14 @@
+import asyncio
 import html
 import logging
 import re
-import json
+import sys
 import time
 import email.utils
-from http.cookies import SimpleCookie
+from collections import Counter
+from functools import lru_cache
 from importlib import resources
-from pathlib import Path
-from typing import Iterable, List
+from typing import Iterable, Iterator, List
 from urllib.parse import parse_qs, quote, urljoin, urlparse, urlsplit
 
 import reflex as rx
@@ -18,13 +19,20 @@ try:
 except ImportError:  # pragma: no cover - optional dependency
     BeautifulSoup = None
 
-from .utils import decode_bundle, decrypt, encrypt, urlsafe_base64
+try:
+    import lxml  # noqa: F401
+except ImportError:  # pragma: no cover - optional dependency
+    _SOUP_PARSER = "html.parser"
+else:
+    _SOUP_PARSER = "lxml"
+
+from .utils import decode_bundle, decrypt, encrypt_cached, json_loads, urlsafe_base64
 from rxconfig import config
 
 
 logger = logging.getLogger(__name__)
 
-PROXYABLE_HLS_EXTENSIONS = {
+PROXYABLE_HLS_EXTENSIONS = frozenset({
     ".m3u8",
     ".ts",
     ".aac",
@@ -33,7 +41,25 @@ PROXYABLE_HLS_EXTENSIONS = {
     ".m4a",
     ".mp4",
     ".mp3",
-}
+})
+
+# Seconds a per-host "has a usable cookie" answer is reused before rescanning.
+COOKIE_CHECK_TTL = 30.0
+
+# Concurrent upstream connections kept open by the shared curl session.
+MAX_UPSTREAM_CLIENTS = 32
+
+# Hosts (and their subdomains) that sit behind the Cloudflare challenge.
+_CHALLENGED_DOMAINS = frozenset({"dlhd.dad"})
+_CHALLENGED_SUFFIXES = tuple(f".{domain}" for domain in _CHALLENGED_DOMAINS)
+
+_CHANNEL_KEY_RE = re.compile(r'const\s+CHANNEL_KEY\s*=\s*"([^"\n]*)";')
+# Key URIs (groups 1-3) and absolute segment URLs (group 4), matched in one scan.
+_M3U8_LINE_RE = re.compile(
+    r'^(?:(#EXT-X-KEY:[^\r\n]*?URI=")([^"\r\n]*)(")|(http[^\r\n]*))', re.MULTILINE
+)
+_DIGIT_RE = re.compile(r"(\d+)")
+_WS_RE = re.compile(r"\s+")
 
 
 class _FlaresolverrResponse:
@@ -45,14 +71,120 @@ class _FlaresolverrResponse:
         self.url = solution.get("url") or ""
 
     def json(self):
-        return json.loads(self.text)
+        return json_loads(self.text)
+
+
+_CARD_HREF = 'href="/watch.php?id='
+_CARD_TITLE_OPEN = '<div class="card__title">'
+_CARD_TITLE_CLOSE = "</div>"
+
+
+def _parse_set_cookie(raw: str) -> tuple[str, str, dict[str, str]]:
+    """Split a ``Set-Cookie`` value into its name, value and lowercased attributes."""
+
+    cookie, *attributes = raw.split(";")
+    name, _, value = cookie.partition("=")
+    value = value.strip()
+    if len(value) > 1 and value[0] == value[-1] == '"':
+        value = value[1:-1]
+    attrs: dict[str, str] = {}
+    for attribute in attributes:
+        key, _, attr_value = attribute.partition("=")
+        attrs[key.strip().lower()] = attr_value.strip()
+    return name.strip(), value, attrs
+
+
+@lru_cache(maxsize=64)
+def _rewrite_playlist(text: str, source_netloc: str, api_url: str, proxy_content: bool) -> str:
+    """Point key URIs and segment URLs of an upstream playlist at this proxy.
+
+    Live playlists are re-fetched every few seconds by every viewer of a
+    channel and usually come back unchanged, so results are memoized on
+    the raw text and every setting that affects the output.
+    """
+
+    key_prefix = f"{api_url}/key/"
+    key_suffix = f"/{encrypt_cached(source_netloc)}"
+    content_prefix = f"{api_url}/content/"
+
+    def rewrite(match: re.Match) -> str:
+        line = match.group(4)
+        if line is None:
+            key_url = key_prefix + encrypt_cached(match.group(2)) + key_suffix
+            return match.group(1) + key_url + match.group(3)
+        if proxy_content or _is_hls_path(urlparse(line).path):
+            return content_prefix + encrypt_cached(line)
+        return line
+
+    playlist = _M3U8_LINE_RE.sub(rewrite, text)
+    return playlist if playlist.endswith("\n") else playlist + "\n"
+
+
+_IFRAME_SRC = 'iframe src="'
+
+
+def _extract_iframe_src(text: str) -> str | None:
+    """Return the ``src`` of the first ``iframe src="..." width`` in *text*."""
+
+    pos = 0
+    while True:
+        start = text.find(_IFRAME_SRC, pos)
+        if start < 0:
+            return None
+        start += len(_IFRAME_SRC)
+        end = text.find('"', start)
+        if end < 0:
+            return None
+        if text.startswith('" width', end):
+            return text[start:end]
+        pos = start
+
+
+def _iter_channel_cards(text: str) -> Iterator[tuple[str, str]]:
+    """Yield ``(channel_id, raw_title)`` pairs from the 24/7 channel listing.
+
+    A forward ``str.find`` scan over the fixed card anchors that accepts
+    the same cards as the listing regex it replaced, without backtracking.
+    """
+
+    pos = 0
+    while True:
+        start = text.find(_CARD_HREF, pos)
+        if start < 0:
+            return
+        id_start = start + len(_CARD_HREF)
+        id_end = id_start
+        while id_end < len(text) and text[id_end].isdigit():
+            id_end += 1
+        pos = id_end
+        if id_end == id_start or text[id_end:id_end + 1] != '"':
+            continue
+        tag_end = text.find(">", id_end)
+        if tag_end < 0:
+            return
+        title_start = tag_end + 1
+        while title_start < len(text) and text[title_start].isspace():
+            title_start += 1
+        if not text.startswith(_CARD_TITLE_OPEN, title_start):
+            continue
+        title_start += len(_CARD_TITLE_OPEN)
+        title_end = text.find(_CARD_TITLE_CLOSE, title_start)
+        if title_end < 0:
+            return
+        yield text[id_start:id_end], text[title_start:title_end]
+        pos = title_end + len(_CARD_TITLE_CLOSE)
 
 
 def _is_hls_path(path: str) -> bool:
     """Return ``True`` when *path* points to a proxyable HLS asset."""
 
-    suffix = Path(path).suffix.lower()
-    return suffix in PROXYABLE_HLS_EXTENSIONS
+    path = path.rstrip("/")
+    dot = path.rfind(".")
+    # Same rules as ``Path.suffix``: the dot must be inside the last
+    # segment and not its first character.
+    if dot <= path.rfind("/") + 1:
+        return False
+    return path[dot:].lower() in PROXYABLE_HLS_EXTENSIONS
 
 
 class Channel(rx.Base):
@@ -66,20 +198,29 @@ class StepDaddy:
     def __init__(self):
         socks5 = config.socks5
         if socks5 != "":
-            self._session = AsyncSession(proxy="socks5://" + socks5)
+            self._session = AsyncSession(
+                proxy="socks5://" + socks5, max_clients=MAX_UPSTREAM_CLIENTS
+            )
         else:
-            self._session = AsyncSession()
+            self._session = AsyncSession(max_clients=MAX_UPSTREAM_CLIENTS)
         self._base_url = "https://dlhd.dad"
         self._flaresolverr_url = config.flaresolverr_url
         self._flaresolverr_timeout = config.flaresolverr_timeout
-        self.channels: list[Channel] = []
+        self.channels = []
         try:
-            meta_data = resources.files(__package__).joinpath("meta.json").read_text()
-            self._meta = json.loads(meta_data)
+            meta_data = resources.files(__package__).joinpath("meta.json").read_bytes()
+            self._meta = json_loads(meta_data)
         except Exception:
             self._meta = {}
+        # meta.json repeats the same few hundred tags across ~800 entries;
+        # intern them so every Channel shares one string per distinct tag.
+        for entry in self._meta.values():
+            if isinstance(entry, dict) and entry.get("tags"):
+                entry["tags"] = [sys.intern(str(tag)) for tag in entry["tags"]]
         self._logged_domains = {"dlhd.dad"}
         self._last_transport_mode: bool | None = None
+        self._cookie_cache: dict[str, tuple[float, bool]] = {}
+        self._pending_solves: dict[str, asyncio.Event] = {}
 
     def _headers(self, referer: str = None, origin: str = None):
         if referer is None:
@@ -101,13 +242,8 @@ class StepDaddy:
                 raise ValueError(
                     f"Failed to load channels: HTTP {response.status_code}"
                 )
-            matches = re.findall(
-                r'href="/watch\.php\?id=(\d+)"[^>]*>\s*<div class="card__title">(.*?)</div>',
-                response.text,
-                re.DOTALL,
-            )
             seen_ids = set()
-            for channel_id, channel_name in matches:
+            for channel_id, channel_name in _iter_channel_cards(response.text):
                 if channel_id in seen_ids:
                     continue
                 seen_ids.add(channel_id)
@@ -133,18 +269,30 @@ class StepDaddy:
                 key=lambda channel: (channel.name.startswith("18"), channel.name),
             )
 
+    @property
+    def channels(self) -> list[Channel]:
+        return self._channels
+
+    @channels.setter
+    def channels(self, channels: list[Channel]) -> None:
+        self._channels = channels
+        self._channels_by_id: dict[str, Channel] = {channel.id: channel for channel in channels}
+
+    def channel(self, channel_id: str) -> Channel | None:
+        """Return the loaded channel with *channel_id*, if any."""
+        return self._channels_by_id.get(channel_id)
+
     async def stream(self, channel_id: str):
-        key = "CHANNEL_KEY"
         url = f"{self._base_url}/stream/stream-{channel_id}.php"
         response = await self._get(url, headers=self._headers())
-        matches = re.compile("iframe src=\"(.*)\" width").findall(response.text)
-        if matches:
-            source_url = matches[0]
+        source_url = _extract_iframe_src(response.text)
+        if source_url:
             source_response = await self._get(source_url, headers=self._headers(url))
         else:
             raise ValueError("Failed to find source URL for channel")
 
-        channel_key = re.compile(rf"const\s+{re.escape(key)}\s*=\s*\"(.*?)\";").findall(source_response.text)[-1]
+        channel_key = _CHANNEL_KEY_RE.findall(source_response.text)[-1]
+        parsed_source = urlsplit(source_url)
         logger.info("Resolved channel %s to source %s with key %s", channel_id, source_url, channel_key)
 
         data = decode_bundle(source_response.text)
@@ -152,7 +300,7 @@ class StepDaddy:
         auth_sig = data.get("b_sig", "")
         auth_rnd = data.get("b_rnd", "")
         raw_auth_url = data.get("b_host", "")
-        auth_url = re.sub(r"\s+", "", raw_auth_url.strip())
+        auth_url = _WS_RE.sub("", raw_auth_url.strip())
         parsed_auth_url = urlparse(auth_url)
         if not parsed_auth_url.scheme or not parsed_auth_url.netloc:
             raise ValueError(
@@ -184,18 +332,22 @@ class StepDaddy:
             auth_base,
             f"auth.php?channel_id={channel_key}&ts={auth_ts}&rnd={auth_rnd}&sig={auth_sig}",
         )
+        key_url = (
+            f"{parsed_source.scheme}://{parsed_source.netloc}"
+            f"/server_lookup.php?channel_id={channel_key}"
+        )
         logger.debug(
             "Requesting auth for channel %s from %s", channel_id, auth_request_url
         )
-        auth_response = await self._get(
-            auth_request_url, headers=self._headers(source_url)
+        logger.debug("Fetching server key for channel %s from %s", channel_id, key_url)
+        # The auth call and the server lookup only depend on the source page,
+        # so issue them concurrently rather than paying two round trips.
+        auth_response, key_response = await asyncio.gather(
+            self._get(auth_request_url, headers=self._headers(source_url)),
+            self._get(key_url, headers=self._headers(source_url)),
         )
         if auth_response.status_code != 200:
             raise ValueError("Failed to get auth response")
-        key_url = urlparse(source_url)
-        key_url = f"{key_url.scheme}://{key_url.netloc}/server_lookup.php?channel_id={channel_key}"
-        logger.debug("Fetching server key for channel %s from %s", channel_id, key_url)
-        key_response = await self._get(key_url, headers=self._headers(source_url))
         raw_server_key = key_response.json().get("server_key")
         if not raw_server_key:
             raise ValueError("No server key found in response")
@@ -229,31 +381,9 @@ class StepDaddy:
             server_url,
             parsed_auth_url.netloc,
         )
-        rewritten_lines: list[str] = []
-        for line in m3u8.text.splitlines():
-            if line.startswith("#EXT-X-KEY:"):
-                original_url = re.search(r'URI="(.*?)"', line).group(1)
-                line = line.replace(
-                    original_url,
-                    f"{config.api_url}/key/{encrypt(original_url)}/{encrypt(urlparse(source_url).netloc)}",
-                )
-                rewritten_lines.append(line)
-                continue
-
-            if line.startswith("http"):
-                parsed_url = urlparse(line)
-                path = (parsed_url.path or "").lower()
-                if _is_hls_path(path):
-                    rewritten_lines.append(f"{config.api_url}/content/{encrypt(line)}")
-                elif config.proxy_content:
-                    rewritten_lines.append(f"{config.api_url}/content/{encrypt(line)}")
-                else:
-                    rewritten_lines.append(line)
-                continue
-
-            rewritten_lines.append(line)
-
-        return "\n".join(rewritten_lines) + "\n"
+        return _rewrite_playlist(
+            m3u8.text, parsed_source.netloc, config.api_url, config.proxy_content
+        )
 
     async def key(self, url: str, host: str):
         url = decrypt(url)
@@ -270,12 +400,13 @@ class StepDaddy:
         return decrypt(path)
 
     def playlist(self, channels: Iterable[Channel] | None = None):
-        data = "#EXTM3U\n"
-        channels = list(channels) if channels is not None else self.channels
+        parts = ["#EXTM3U\n"]
+        channels = channels if channels is not None else self.channels
+        base = config.api_url
         for channel in channels:
             entry = f" tvg-logo=\"{channel.logo}\",{channel.name}" if channel.logo else f",{channel.name}"
-            data += f"#EXTINF:-1{entry}\n{config.api_url}/stream/{channel.id}.m3u8\n"
-        return data
+            parts.append(f"#EXTINF:-1{entry}\n{base}/stream/{channel.id}.m3u8\n")
+        return "".join(parts)
 
     async def schedule(self):
         for path in ("/schedule", "/"):
@@ -308,7 +439,7 @@ class StepDaddy:
         if BeautifulSoup is None:
             raise ValueError("BeautifulSoup is required to parse schedule HTML")
 
-        soup = BeautifulSoup(payload, "html.parser")
+        soup = BeautifulSoup(payload, _SOUP_PARSER)
         container = soup.select_one("div.schedule")
         if not container:
             raise ValueError("Schedule container not found")
@@ -363,7 +494,7 @@ class StepDaddy:
                                     if ids:
                                         channel_id = ids[0]
                                 if not channel_id:
-                                    match = re.search(r"(\d+)", href)
+                                    match = _DIGIT_RE.search(href)
                                     if match:
                                         channel_id = match.group(1)
                             name = (link.get("title") or link.get_text()).strip()
@@ -389,7 +520,7 @@ class StepDaddy:
                         alt_channels: list[dict[str, str]] = []
                         for link in alt_container.find_all("a"):
                             href = link.get("href", "")
-                            match = re.search(r"(\d+)", href)
+                            match = _DIGIT_RE.search(href)
                             if not match:
                                 continue
                             name = (link.get("title") or link.get_text()).strip()
@@ -420,6 +551,12 @@ class StepDaddy:
     async def aclose(self) -> None:
         await self._session.close()
 
+    async def __aenter__(self) -> "StepDaddy":
+        return self
+
+    async def __aexit__(self, *_exc_info) -> None:
+        await self.aclose()
+
     def _should_log_url(self, url: str) -> bool:
         netloc = urlsplit(url).netloc.lower()
         return any(netloc.endswith(domain) for domain in self._logged_domains)
@@ -429,7 +566,8 @@ class StepDaddy:
         transport = " via Flaresolverr" if use_flaresolverr else ""
         try:
             if use_flaresolverr:
-                response = await self._flaresolverr_get(url, **kwargs)
+                response, use_flaresolverr = await self._solve_get(url, **kwargs)
+                transport = " via Flaresolverr" if use_flaresolverr else ""
             else:
                 response = await self._session.get(url, **kwargs)
         except Exception:
@@ -470,6 +608,30 @@ class StepDaddy:
                 )
         return response
 
+    async def _solve_get(self, url: str, **kwargs):
+        """Fetch ``url`` through Flaresolverr, sharing an in-flight solve per host.
+
+        Concurrent requests for a host wait for the first solve to finish and
+        go direct if it left usable cookies behind. Returns the response and
+        whether Flaresolverr served it.
+        """
+
+        hostname = (urlsplit(url).hostname or "").lower()
+        pending = self._pending_solves.get(hostname)
+        if pending is not None:
+            await pending.wait()
+            if not self._should_use_flaresolverr(url):
+                return await self._session.get(url, **kwargs), False
+            return await self._flaresolverr_get(url, **kwargs), True
+
+        event = asyncio.Event()
+        self._pending_solves[hostname] = event
+        try:
+            return await self._flaresolverr_get(url, **kwargs), True
+        finally:
+            del self._pending_solves[hostname]
+            event.set()
+
     def _should_use_flaresolverr(self, url: str) -> bool:
         if not self._can_use_flaresolverr(url):
             return False
@@ -478,9 +640,10 @@ class StepDaddy:
         return not self._has_valid_cookie(hostname)
 
     def _can_use_flaresolverr(self, url: str) -> bool:
+        if not (self._flaresolverr_url or config.flaresolverr_url):
+            return False
         hostname = (urlsplit(url).hostname or "").lower()
-        flaresolverr_url = self._flaresolverr_url or config.flaresolverr_url
-        return bool(flaresolverr_url) and hostname.endswith("dlhd.dad")
+        return hostname in _CHALLENGED_DOMAINS or hostname.endswith(_CHALLENGED_SUFFIXES)
 
     async def _flaresolverr_get(self, url: str, headers=None, timeout: int | None = None, **_kwargs):
         flaresolverr_url = self._flaresolverr_url or config.flaresolverr_url
@@ -511,10 +674,14 @@ class StepDaddy:
                 f"Flaresolverr request failed with HTTP {response.status_code}"
             )
 
+        # The envelope embeds the whole page as one JSON string; decode the
+        # raw body with json_loads (orjson when installed) rather than .json().
         try:
-            payload = response.json()
+            payload = json_loads(response.content)
         except Exception as exc:
             raise ValueError("Invalid Flaresolverr response") from exc
+        if not isinstance(payload, dict):
+            raise ValueError("Invalid Flaresolverr response")
 
         if payload.get("status") != "ok":
             message = payload.get("message") or "Unknown Flaresolverr error"
@@ -530,55 +697,68 @@ class StepDaddy:
             if key.lower() != "set-cookie":
                 continue
 
-            if isinstance(value, list):
-                cookies_raw.extend([str(item) for item in value])
-            else:
-                cookies_raw.append(str(value))
+            # Flaresolverr folds repeated Set-Cookie headers into one
+            # newline-separated string.
+            items = value if isinstance(value, list) else [value]
+            for item in items:
+                cookies_raw.extend(line for line in str(item).splitlines() if line.strip())
 
         if not cookies_raw:
             return
 
         hostname = (urlsplit(url).hostname or "dlhd.dad").lower()
         now = time.time()
+        self._cookie_cache.clear()
 
         for raw_cookie in cookies_raw:
-            parsed = SimpleCookie()
-            parsed.load(raw_cookie)
-            for morsel in parsed.values():
-                expires = None
-                if morsel["max-age"]:
-                    try:
-                        expires = now + int(morsel["max-age"])
-                    except (TypeError, ValueError):  # pragma: no cover - defensive
-                        expires = None
-                elif morsel["expires"]:
-                    try:
-                        expires_dt = email.utils.parsedate_to_datetime(morsel["expires"])
-                        expires = expires_dt.timestamp()
-                    except (TypeError, ValueError, OverflowError):  # pragma: no cover
-                        expires = None
-
-                domain = morsel["domain"] or hostname
-                path = morsel["path"] or "/"
-                self._session.cookies.set(
-                    morsel.key, morsel.value, domain=domain, path=path, expires=expires
-                )
+            name, value, attrs = _parse_set_cookie(raw_cookie)
+            if not name:
+                continue
+
+            expires = None
+            if attrs.get("max-age"):
+                try:
+                    expires = now + int(attrs["max-age"])
+                except ValueError:  # pragma: no cover - defensive
+                    expires = None
+            elif attrs.get("expires"):
+                try:
+                    expires_dt = email.utils.parsedate_to_datetime(attrs["expires"])
+                    expires = expires_dt.timestamp()
+                except (TypeError, ValueError, OverflowError):  # pragma: no cover
+                    expires = None
+
+            domain = attrs.get("domain") or hostname
+            path = attrs.get("path") or "/"
+            self._session.cookies.set(
+                name, value, domain=domain, path=path, expires=expires
+            )
 
     def _has_valid_cookie(self, hostname: str) -> bool:
         now = time.time()
+        cached = self._cookie_cache.get(hostname)
+        if cached is not None and cached[0] > now:
+            return cached[1]
+
         cookies = getattr(self._session, "cookies", None)
         if cookies is None:  # pragma: no cover - defensive
             return False
 
+        valid = False
+        cache_until = now + COOKIE_CHECK_TTL
         for cookie in cookies:
             domain = (cookie.domain or "").lstrip(".").lower()
             if domain and not hostname.endswith(domain):
                 continue
 
             if cookie.expires is None or cookie.expires > now:
-                return True
+                valid = True
+                if cookie.expires is not None:
+                    cache_until = min(cache_until, cookie.expires)
+                break
 
-        return False
+        self._cookie_cache[hostname] = (cache_until, valid)
+        return valid
 
     def _log_transport_change(self, using_flaresolverr: bool, url: str) -> None:
         previous_mode = self._last_transport_mode
@@ -596,13 +776,16 @@ class StepDaddy:
 
     @staticmethod
     def _enumerate_duplicate_names(channels: Iterable[Channel]) -> None:
-        channel_list = list(channels)
-        counts: dict[str, int] = {}
-        for channel in channel_list:
-            counts[channel.name] = counts.get(channel.name, 0) + 1
+        channel_list = channels if isinstance(channels, list) else list(channels)
+        if len(channel_list) < 2:
+            return
+        counts = Counter(channel.name for channel in channel_list)
+        duplicates = {name for name, count in counts.items() if count > 1}
+        if not duplicates:
+            return
 
         seen: dict[str, int] = {}
         for channel in channel_list:
-            if counts[channel.name] > 1:
+            if channel.name in duplicates:
                 seen[channel.name] = seen.get(channel.name, 0) + 1
                 channel.name = f"{channel.name} ({seen[channel.name]})"
@@ -3,15 +3,22 @@ import binascii
 import json
 import os
 import re
+from functools import lru_cache
 from pathlib import Path
 from typing import Any
 
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
 KEY_FILE_ENV_VAR = "DLHD_PROXY_KEY_FILE"
 DEFAULT_KEY_PATH = Path("data/token.key")
 MIN_KEY_LENGTH = 32
 GENERATED_KEY_LENGTH = 64
 PAYLOAD_PREFIX = b"dlhd_proxy::"
 PAYLOAD_PREFIX_STR = PAYLOAD_PREFIX.decode()
+_TOKEN_RE = re.compile(r"[A-Za-z0-9_-]+=?=?")
 
 
 def _key_file_path() -> Path:
@@ -21,8 +28,7 @@ def _key_file_path() -> Path:
     return DEFAULT_KEY_PATH
 
 
-def _load_or_create_key() -> bytes:
-    path = _key_file_path()
+def _load_or_create_key(path: Path) -> bytes:
     try:
         data = path.read_bytes()
     except FileNotFoundError:
@@ -48,7 +54,7 @@ def _load_or_create_key() -> bytes:
     try:
         fd = os.open(path, flags, mode)
     except FileExistsError:
-        return _load_or_create_key()
+        return _load_or_create_key(path)
     except OSError as exc:
         raise RuntimeError(f"Unable to create token key at {path}: {exc}") from exc
 
@@ -61,7 +67,15 @@ def _load_or_create_key() -> bytes:
     return key
 
 
-key_bytes = _load_or_create_key()
+@lru_cache(maxsize=None)
+def load_key(path: str | None = None) -> bytes:
+    """Return the token key at *path*, creating it on first use.
+
+    Defaults to ``$DLHD_PROXY_KEY_FILE`` or ``data/token.key``. The key is
+    read once per path; call ``load_key.cache_clear()`` (and
+    ``encrypt_cached.cache_clear()``) after replacing it.
+    """
+    return _load_or_create_key(Path(path).expanduser() if path else _key_file_path())
 
 
 def encrypt(input_string: str):
@@ -70,11 +84,15 @@ def encrypt(input_string: str):
     return base64.urlsafe_b64encode(result).decode().rstrip('=')
 
 
+# Live playlists repeat the same segment and key URLs on every refresh.
+encrypt_cached = lru_cache(maxsize=8192)(encrypt)
+
+
 def decrypt(input_string: str):
     padding_needed = (-len(input_string)) % 4
     if padding_needed:
         input_string += "=" * padding_needed
-    if not re.fullmatch(r"[A-Za-z0-9_-]+=?=?", input_string):
+    if not _TOKEN_RE.fullmatch(input_string):
         raise ValueError("Invalid encrypted payload")
     try:
         input_bytes = base64.urlsafe_b64decode(input_string)
@@ -91,7 +109,19 @@ def decrypt(input_string: str):
 
 
 def xor(input_bytes):
-    return bytes([input_bytes[i] ^ key_bytes[i % len(key_bytes)] for i in range(len(input_bytes))])
+    # XOR the whole buffer as one big integer instead of byte by byte.
+    key_bytes = load_key()
+    length = len(input_bytes)
+    keystream = (key_bytes * (length // len(key_bytes) + 1))[:length]
+    result = int.from_bytes(input_bytes, "big") ^ int.from_bytes(keystream, "big")
+    return result.to_bytes(length, "big")
+
+
+def json_loads(data: str | bytes) -> Any:
+    """Decode JSON with orjson when it is installed, else the stdlib."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
 
 
 def urlsafe_base64(input_string: str) -> str:
@@ -109,24 +139,45 @@ def urlsafe_base64_decode(base64_string: str) -> str:
     return decoded_bytes.decode("utf-8")
 
 
+@lru_cache(maxsize=64)
+def _var_re(var_name: str) -> re.Pattern:
+    return re.compile(rf'var\s+{re.escape(var_name)}\s*=\s*atob\("([^"]+)"\);')
+
+
 def extract_and_decode_var(var_name: str, response: str) -> str:
-    pattern = rf'var\s+{re.escape(var_name)}\s*=\s*atob\("([^"]+)"\);'
-    matches = re.findall(pattern, response)
+    matches = _var_re(var_name).findall(response)
     if not matches:
         raise ValueError(f"Variable '{var_name}' not found in response")
     b64 = matches[-1]
     return base64.b64decode(b64).decode("utf-8")
 
 
+_B64_VALUE_RE = re.compile(r"[A-Za-z0-9+/]*={0,2}")
+_BUNDLE_CANDIDATE_RES = (
+    re.compile(r'JSON\.parse\s*\(\s*atob\s*\(\s*["\']([^"\']{40,})["\']\s*\)\s*\)'),
+    re.compile(r'atob\s*\(\s*["\'](eyJ[A-Za-z0-9+/=]{40,})["\']\s*\)'),
+    re.compile(
+        r'(?:const|let|var)\s+[A-Za-z_$][\w$]*\s*=\s*["\'](eyJ[A-Za-z0-9+/=]{40,})["\']'
+    ),
+    re.compile(r'["\'](eyJ[A-Za-z0-9+/=]{40,})["\']'),
+    re.compile(r'["\']([A-Za-z0-9+/=]{80,})["\']'),
+)
+
+
 def decode_bundle(response_text: str) -> dict[str, Any]:
     def normalize(data: dict[str, Any]) -> dict[str, Any]:
         decoded: dict[str, Any] = {}
         for key, value in data.items():
             if isinstance(value, str):
+                # b64decode used to skip stray whitespace; keep accepting it.
+                compact = "".join(value.split())
+                padded = compact + "=" * (-len(compact) % 4)
+                if not _B64_VALUE_RE.fullmatch(padded):
+                    decoded[key] = value
+                    continue
                 try:
-                    pad = "=" * (-len(value) % 4)
-                    decoded[key] = base64.b64decode(value + pad).decode("utf-8")
-                except Exception:
+                    decoded[key] = base64.b64decode(padded, validate=True).decode("utf-8")
+                except (binascii.Error, UnicodeDecodeError):
                     decoded[key] = value
             else:
                 decoded[key] = value
@@ -134,37 +185,22 @@ def decode_bundle(response_text: str) -> dict[str, Any]:
 
     def parse_candidate(candidate: str) -> dict[str, Any] | None:
         try:
-            decoded_candidate = base64.b64decode(candidate + "=" * (-len(candidate) % 4)).decode(
-                "utf-8"
-            )
+            decoded_candidate = base64.b64decode(candidate + "=" * (-len(candidate) % 4))
         except Exception:
             return None
         try:
-            data = json.loads(decoded_candidate)
-        except json.JSONDecodeError:
+            data = json_loads(decoded_candidate)
+        except ValueError:
             return None
-        if any(key in data for key in ("b_ts", "b_sig", "b_host", "b_rnd")):
+        if isinstance(data, dict) and any(
+            key in data for key in ("b_ts", "b_sig", "b_host", "b_rnd")
+        ):
             return normalize(data)
         return None
 
     candidates = {response_text.strip()}
-    candidates.update(
-        re.findall(
-            r'JSON\.parse\s*\(\s*atob\s*\(\s*["\']([^"\']{40,})["\']\s*\)\s*\)',
-            response_text,
-        )
-    )
-    candidates.update(
-        re.findall(r'atob\s*\(\s*["\'](eyJ[A-Za-z0-9+/=]{40,})["\']\s*\)', response_text)
-    )
-    candidates.update(
-        re.findall(
-            r'(?:const|let|var)\s+[A-Za-z_$][\w$]*\s*=\s*["\'](eyJ[A-Za-z0-9+/=]{40,})["\']',
-            response_text,
-        )
-    )
-    candidates.update(re.findall(r'["\'](eyJ[A-Za-z0-9+/=]{40,})["\']', response_text))
-    candidates.update(re.findall(r'["\']([A-Za-z0-9+/=]{80,})["\']', response_text))
+    for pattern in _BUNDLE_CANDIDATE_RES:
+        candidates.update(pattern.findall(response_text))
 
     for candidate in candidates:
         decoded = parse_candidate(candidate)
@@ -3,6 +3,8 @@ from pathlib import Path
 
 from xml.etree import ElementTree
 
+import pytest
+
 from dlhd_proxy import backend
 from dlhd_proxy.step_daddy import Channel
 
@@ -82,3 +84,45 @@ def test_get_schedule_keeps_events_with_duplicate_channel_names(monkeypatch):
     assert channels_out == [
         {"channel_id": "1", "channel_name": "MLB League Pass"}
     ]
+
+
+def test_selected_channel_ids_reload_when_file_changes(tmp_path, monkeypatch):
+    channel_file = tmp_path / "selected_channels.json"
+    channel_file.write_text('["1"]')
+    monkeypatch.setattr(backend, "CHANNEL_FILE", channel_file)
+    monkeypatch.setattr(backend, "LEGACY_CHANNEL_FILE", tmp_path / "channels.json")
+    monkeypatch.setattr(backend, "_selection_cache", None)
+
+    assert backend.get_selected_channel_ids() == {"1"}
+    assert backend.get_selected_channel_ids() == {"1"}
+
+    channel_file.write_text('["1", "2"]')
+
+    assert backend.get_selected_channel_ids() == {"1", "2"}
+
+
+def test_get_channel_looks_up_loaded_channels(monkeypatch):
+    channels = [
+        Channel(id="1", name="One", tags=[], logo=None),
+        Channel(id="2", name="Two", tags=[], logo=None),
+    ]
+    monkeypatch.setattr(backend.step_daddy, "channels", channels, raising=False)
+
+    assert backend.get_channel("1") is channels[0]
+    assert backend.get_channel("missing") is None
+    assert backend.get_channel("") is None
+
+
+def test_startup_fails_fast_on_invalid_token_key(monkeypatch):
+    def fake_load_key():
+        raise RuntimeError("Token key at data/token.key must be at least 32 bytes")
+
+    async def fail_load_channels():  # pragma: no cover - defensive
+        raise AssertionError("channels should not load without a key")
+
+    monkeypatch.setattr(backend, "load_key", fake_load_key)
+    monkeypatch.setattr(backend.step_daddy, "channels", [])
+    monkeypatch.setattr(backend.step_daddy, "load_channels", fail_load_channels)
+
+    with pytest.raises(RuntimeError, match="Token key"):
+        asyncio.run(backend._startup())
@@ -1,13 +1,30 @@
 import asyncio
+import json
+import re
 import time
 
 import pytest
 
-from dlhd_proxy.step_daddy import Channel, StepDaddy
+from dlhd_proxy.step_daddy import (
+    Channel,
+    StepDaddy,
+    _extract_iframe_src,
+    _is_hls_path,
+    _iter_channel_cards,
+    _parse_set_cookie,
+    _rewrite_playlist,
+)
 from dlhd_proxy.utils import urlsafe_base64
 from rxconfig import config
 
 
+@pytest.fixture(autouse=True)
+def clear_playlist_memo():
+    _rewrite_playlist.cache_clear()
+    yield
+    _rewrite_playlist.cache_clear()
+
+
 def test_enumerate_duplicate_names():
     channels = [
         Channel(id="1", name="MLB League Pass", tags=[], logo="logo1"),
@@ -76,6 +93,87 @@ def test_load_channels_parses_stream_list(monkeypatch):
     )
 
 
+def test_iter_channel_cards_matches_regex():
+    html = """
+    <a class="card" href="/watch.php?id=149" data-title="espn sur">
+        <div class="card__title">ESPN SUR</div>
+    </a>
+    <a class="card" href="/watch.php?id=abc"><div class="card__title">Bad id</div></a>
+    <a class="card" href="/watch.php?id=12">Not a card<div class="card__title">Skip</div></a>
+    <a class="card" href="/watch.php?id=13">
+        <div class="card__title">Sky &amp; More</div>
+    </a>
+    """
+
+    channels_re = re.compile(
+        r'href="/watch\.php\?id=(\d+)"[^>]*>\s*<div class="card__title">(.*?)</div>',
+        re.DOTALL,
+    )
+
+    cards = list(_iter_channel_cards(html))
+
+    assert cards == [("149", "ESPN SUR"), ("13", "Sky &amp; More")]
+    assert cards == channels_re.findall(html)
+
+
+@pytest.mark.parametrize(
+    ("path", "expected"),
+    [
+        ("/video1.TS", True),
+        ("/live/variant.m3u8", True),
+        ("/segment", False),
+        ("", False),
+        ("/thumbnail.png", False),
+        ("/hidden/.ts", False),
+        ("/dir.ts/", True),
+    ],
+)
+def test_is_hls_path(path: str, expected: bool):
+    assert _is_hls_path(path) is expected
+
+
+@pytest.mark.parametrize(
+    ("segment", "proxied"),
+    [
+        ("https://cdn.example.com/a.ts?token=1", True),
+        ("https://cdn.example.com/a.ts;p=1", True),
+        ("https://cdn.example.ts", False),
+        ("https://cdn.example.com/thumbnail.png", False),
+    ],
+)
+def test_rewrite_playlist_checks_segment_path(monkeypatch, segment: str, proxied: bool):
+    monkeypatch.setattr("dlhd_proxy.step_daddy.encrypt_cached", lambda value: f"enc({value})")
+
+    playlist = _rewrite_playlist(f"#EXTM3U\n{segment}\n", "source.example", "http://api", False)
+
+    expected = f"http://api/content/enc({segment})" if proxied else segment
+    assert playlist == f"#EXTM3U\n{expected}\n"
+
+
+def test_rewrite_playlist_memoizes_per_settings(monkeypatch):
+    calls = []
+
+    def fake_encrypt(value):
+        calls.append(value)
+        return f"enc({value})"
+
+    monkeypatch.setattr("dlhd_proxy.step_daddy.encrypt_cached", fake_encrypt)
+    text = "#EXTM3U\nhttps://cdn.example.com/thumb.png\n"
+
+    first = _rewrite_playlist(text, "source.example", "http://api", False)
+    encrypted = len(calls)
+    assert _rewrite_playlist(text, "source.example", "http://api", False) is first
+    assert len(calls) == encrypted
+
+    proxied = _rewrite_playlist(text, "source.example", "http://api", True)
+    other_api = _rewrite_playlist(text, "source.example", "http://other", True)
+
+    assert first == text
+    assert proxied == "#EXTM3U\nhttp://api/content/enc(https://cdn.example.com/thumb.png)\n"
+    assert other_api == "#EXTM3U\nhttp://other/content/enc(https://cdn.example.com/thumb.png)\n"
+    assert _rewrite_playlist.cache_info().misses == 3
+
+
 def test_load_channels_logs_request_status(monkeypatch, caplog):
     html = """
     <div class="grid">
@@ -117,6 +215,7 @@ def test_get_uses_flaresolverr_for_dlhd_domain(monkeypatch, caplog):
         def __init__(self, json_data=None, status_code: int = 200):
             self._json_data = json_data
             self.status_code = status_code
+            self.content = json.dumps(json_data or {}).encode()
 
         def json(self):
             if self._json_data is None:
@@ -152,6 +251,56 @@ def test_get_uses_flaresolverr_for_dlhd_domain(monkeypatch, caplog):
     assert any("via Flaresolverr" in record.getMessage() for record in caplog.records)
 
 
+@pytest.mark.parametrize("content", [b"<html>Bad gateway</html>", b"[]"])
+def test_flaresolverr_rejects_invalid_json(content: bytes):
+    class FakeResponse:
+        status_code = 200
+
+        def __init__(self, body: bytes):
+            self.content = body
+
+    class FakeSession:
+        def __init__(self):
+            self.cookies = FakeCookieJar()
+
+        async def post(self, *_args, **_kwargs):
+            return FakeResponse(content)
+
+    step_daddy = StepDaddy()
+    step_daddy._flaresolverr_url = "http://solver:8191/v1"
+    step_daddy._session = FakeSession()
+
+    with pytest.raises(ValueError, match="Invalid Flaresolverr response"):
+        asyncio.run(step_daddy._flaresolverr_get("https://dlhd.dad/example"))
+
+
+@pytest.mark.parametrize(
+    ("url", "expected"),
+    [
+        ("https://dlhd.dad/example", True),
+        ("https://www.DLHD.dad/example", True),
+        ("https://evildlhd.dad/example", False),
+        ("https://cdn.example.com/video.ts", False),
+    ],
+)
+def test_can_use_flaresolverr_matches_challenged_domains(monkeypatch, url: str, expected: bool):
+    monkeypatch.setattr(config, "flaresolverr_url", "http://solver:8191/v1", raising=False)
+    step_daddy = StepDaddy()
+    step_daddy._flaresolverr_url = config.flaresolverr_url
+
+    assert step_daddy._can_use_flaresolverr(url) is expected
+
+
+def test_extract_iframe_src():
+    html = (
+        '<iframe src="https://ads.example/banner" height="90"></iframe>'
+        '<iframe src="https://source.example/player" width="640"></iframe>'
+    )
+
+    assert _extract_iframe_src(html) == "https://source.example/player"
+    assert _extract_iframe_src("<p>no player</p>") is None
+
+
 def test_stream_rejects_invalid_auth_host_port(monkeypatch):
     step_daddy = StepDaddy()
 
@@ -212,6 +361,7 @@ def test_flaresolverr_cookies_enable_direct_requests(monkeypatch, caplog):
         def __init__(self, json_data=None, status_code: int = 200):
             self._json_data = json_data or {}
             self.status_code = status_code
+            self.content = json.dumps(json_data or {}).encode()
 
         def json(self):
             return self._json_data
@@ -257,6 +407,90 @@ def test_flaresolverr_cookies_enable_direct_requests(monkeypatch, caplog):
     assert any("Transport" in record.getMessage() for record in caplog.records)
 
 
+def test_concurrent_requests_share_one_flaresolverr_solve(monkeypatch):
+    monkeypatch.setattr(config, "flaresolverr_url", "http://solver:8191/v1", raising=False)
+
+    class FakeResponse:
+        def __init__(self, json_data=None, status_code: int = 200):
+            self._json_data = json_data or {}
+            self.status_code = status_code
+            self.content = json.dumps(json_data or {}).encode()
+
+        def json(self):
+            return self._json_data
+
+    class FakeSession:
+        def __init__(self):
+            self.cookies = FakeCookieJar()
+            self.direct_calls = 0
+            self.flaresolverr_calls = 0
+
+        async def post(self, *_args, **_kwargs):
+            self.flaresolverr_calls += 1
+            await asyncio.sleep(0)
+            return FakeResponse(
+                {
+                    "status": "ok",
+                    "solution": {
+                        "status": 200,
+                        "response": "{}",
+                        "url": "https://dlhd.dad/example",
+                        "headers": {
+                            "Set-Cookie": "session=abc123; Max-Age=60; Domain=dlhd.dad; Path=/",
+                        },
+                    },
+                }
+            )
+
+        async def get(self, *_args, **_kwargs):
+            self.direct_calls += 1
+            return FakeResponse({"ok": True}, status_code=200)
+
+    step_daddy = StepDaddy()
+    step_daddy._flaresolverr_url = config.flaresolverr_url
+    step_daddy._session = FakeSession()
+
+    async def fetch_all():
+        return await asyncio.gather(
+            *(step_daddy._get(f"https://dlhd.dad/example?n={n}") for n in range(5))
+        )
+
+    responses = asyncio.run(fetch_all())
+
+    assert [response.status_code for response in responses] == [200] * 5
+    assert step_daddy._session.flaresolverr_calls == 1
+    assert step_daddy._session.direct_calls == 4
+    assert step_daddy._pending_solves == {}
+
+
+def test_parse_set_cookie_reads_attributes():
+    name, value, attrs = _parse_set_cookie(
+        'cf_clearance="abc123"; Max-Age=60; Domain=.dlhd.dad; Path=/; HttpOnly'
+    )
+
+    assert (name, value) == ("cf_clearance", "abc123")
+    assert attrs == {"max-age": "60", "domain": ".dlhd.dad", "path": "/", "httponly": ""}
+
+
+def test_store_solution_cookies_splits_folded_headers():
+    class FakeSession:
+        def __init__(self):
+            self.cookies = FakeCookieJar()
+
+    step_daddy = StepDaddy()
+    step_daddy._session = FakeSession()
+
+    step_daddy._store_solution_cookies(
+        "https://dlhd.dad/example",
+        {"set-cookie": "cf_clearance=abc; Path=/\n__cf_bm=xyz; Max-Age=60"},
+    )
+
+    assert [(cookie.name, cookie.value) for cookie in step_daddy._session.cookies] == [
+        ("cf_clearance", "abc"),
+        ("__cf_bm", "xyz"),
+    ]
+
+
 def test_direct_requests_fall_back_on_403(monkeypatch, caplog):
     caplog.set_level("INFO")
     monkeypatch.setattr(config, "flaresolverr_url", "http://solver:8191/v1", raising=False)
@@ -265,6 +499,7 @@ def test_direct_requests_fall_back_on_403(monkeypatch, caplog):
         def __init__(self, json_data=None, status_code: int = 200):
             self._json_data = json_data or {}
             self.status_code = status_code
+            self.content = json.dumps(json_data or {}).encode()
 
         def json(self):
             return self._json_data
@@ -359,7 +594,7 @@ https://cdn.example.com/segment
         "b_rnd": "rnd",
         "b_host": "https://auth.example.com/",
     })
-    monkeypatch.setattr("dlhd_proxy.step_daddy.encrypt", lambda value: f"enc({value})")
+    monkeypatch.setattr("dlhd_proxy.step_daddy.encrypt_cached", lambda value: f"enc({value})")
     monkeypatch.setattr(config, "proxy_content", True, raising=False)
     monkeypatch.setattr(step_daddy, "_get", fake_get.__get__(step_daddy, StepDaddy))
 
@@ -427,7 +662,7 @@ https://cdn.example.com/segment
         "b_rnd": "rnd",
         "b_host": "https://auth.example.com/",
     })
-    monkeypatch.setattr("dlhd_proxy.step_daddy.encrypt", lambda value: f"enc({value})")
+    monkeypatch.setattr("dlhd_proxy.step_daddy.encrypt_cached", lambda value: f"enc({value})")
     monkeypatch.setattr(config, "proxy_content", False, raising=False)
     monkeypatch.setattr(step_daddy, "_get", fake_get.__get__(step_daddy, StepDaddy))
 
@@ -513,8 +748,77 @@ def test_stream_rejects_invalid_server_key(monkeypatch):
         "b_rnd": "rnd",
         "b_host": "https://auth.example.com/",
     })
-    monkeypatch.setattr("dlhd_proxy.step_daddy.encrypt", lambda value: f"enc({value})")
+    monkeypatch.setattr("dlhd_proxy.step_daddy.encrypt_cached", lambda value: f"enc({value})")
     monkeypatch.setattr(step_daddy, "_get", fake_get.__get__(step_daddy, StepDaddy))
 
     with pytest.raises(ValueError, match="server key .*unexpected characters"):
         asyncio.run(step_daddy.stream("42"))
+
+
+SCHEDULE_HTML = """
+<div class="schedule">
+  <div class="schedule__day">
+    <div class="schedule__dayTitle">Monday 14th Oct 2024 - Schedule Time UK GMT</div>
+    <div class="schedule__category">
+      <div class="schedule__catHeader"><div class="card__meta">Soccer</div></div>
+      <div class="schedule__event">
+        <div class="schedule__eventHeader" data-title="fallback title">
+          <span class="schedule__time" data-time="15:00">3pm</span>
+          <span class="schedule__eventTitle">Arsenal &amp; Co vs <span>Chelsea</span>
+        </div>
+        <div class="schedule__channels">
+          <a href="/watch.php?id=51" title="Sky Sports Main Event">Sky</a>
+          <a href="/stream/stream-44.php">ESPN</a>
+          <a href="/watch.php">No id</a>
+        </div>
+        <div class="schedule__channelsAlt">
+          <a href="/stream/stream-99.php">Alt One</a>
+        </div>
+      </div>
+      <div class="schedule__event">
+        <div class="schedule__eventHeader" data-title="Untitled Match">
+          <span class="schedule__time">18:30</span>
+        </div>
+        <div class="schedule__channels"><a href="/watch.php?id=7">DAZN<br>1</a></div>
+      </div>
+    </div>
+    <div class="schedule__category">
+      <div class="schedule__catHeader"><div class="card__meta">Tennis</div></div>
+      <div class="schedule__event">
+        <div class="schedule__eventHeader"><span class="schedule__eventTitle">No channels</span></div>
+      </div>
+    </div>
+  </div>
+  <div class="schedule__day"><div class="schedule__dayTitle"></div></div>
+</div>
+"""
+
+
+@pytest.mark.parametrize("parser", ["html.parser", "lxml"])
+def test_parse_schedule_html(monkeypatch, parser: str):
+    if parser == "lxml":
+        pytest.importorskip("lxml")
+    monkeypatch.setattr("dlhd_proxy.step_daddy._SOUP_PARSER", parser)
+
+    schedule = StepDaddy._parse_schedule_html(SCHEDULE_HTML)
+
+    assert schedule == {
+        "Monday 14th Oct 2024 - Schedule Time UK GMT": {
+            "Soccer": [
+                {
+                    "time": "15:00",
+                    "event": "Arsenal & Co vsChelsea",
+                    "channels": [
+                        {"channel_id": "51", "channel_name": "Sky Sports Main Event"},
+                        {"channel_id": "44", "channel_name": "ESPN"},
+                    ],
+                    "channels2": [{"channel_id": "99", "channel_name": "Alt One"}],
+                },
+                {
+                    "time": "18:30",
+                    "event": "Untitled Match",
+                    "channels": [{"channel_id": "7", "channel_name": "DAZN1"}],
+                },
+            ]
+        }
+    }
@@ -1,5 +1,4 @@
 import base64
-import importlib
 import json
 
 import pytest
@@ -8,11 +7,14 @@ from dlhd_proxy import utils
 
 
 @pytest.fixture(autouse=True)
-def reload_utils_with_temp_key(tmp_path, monkeypatch):
+def use_temp_key(tmp_path, monkeypatch):
     key_path = tmp_path / "token.key"
     monkeypatch.setenv("DLHD_PROXY_KEY_FILE", str(key_path))
-    importlib.reload(utils)
+    utils.load_key.cache_clear()
+    utils.encrypt_cached.cache_clear()
     yield
+    utils.load_key.cache_clear()
+    utils.encrypt_cached.cache_clear()
 
 
 @pytest.mark.parametrize(
@@ -47,6 +49,17 @@ def test_decode_bundle_handles_nested_strings() -> None:
     assert decoded["nested"] == bundle_data["nested"]
 
 
+@pytest.mark.parametrize(
+    "b_host",
+    [" aHR0cHM6Ly9hLmV4YW1wbGUuY29tLw== ", "aHR0cHM6Ly9h\nLmV4YW1wbGUuY29tLw=="],
+)
+def test_decode_bundle_ignores_whitespace_in_values(b_host: str) -> None:
+    bundle_data = {"b_ts": "MTIz", "b_host": b_host}
+    encoded_bundle = base64.b64encode(json.dumps(bundle_data).encode()).decode()
+    decoded = utils.decode_bundle(encoded_bundle)
+    assert decoded["b_host"] == "https://a.example.com/"
+
+
 def test_extract_and_decode_var_success() -> None:
     secret = base64.b64encode(b"abc").decode()
     response = f"var SECRET = atob(\"{secret}\");"
@@ -64,29 +77,26 @@ def test_decrypt_invalid_base64(invalid: str) -> None:
         utils.decrypt(invalid)
 
 
-def test_token_key_file_is_created(tmp_path, monkeypatch) -> None:
+def test_token_key_file_is_created(tmp_path) -> None:
     key_path = tmp_path / "custom.key"
-    monkeypatch.setenv("DLHD_PROXY_KEY_FILE", str(key_path))
-    module = importlib.reload(utils)
+    key_bytes = utils.load_key(str(key_path))
     assert key_path.exists()
-    assert key_path.read_bytes() == module.key_bytes
+    assert key_path.read_bytes() == key_bytes
 
 
 def test_token_key_file_reuse(tmp_path, monkeypatch) -> None:
     key_path = tmp_path / "persist.key"
     monkeypatch.setenv("DLHD_PROXY_KEY_FILE", str(key_path))
-    module = importlib.reload(utils)
-    token = module.encrypt("hello-world")
+    token = utils.encrypt("hello-world")
     key_bytes = key_path.read_bytes()
 
-    module = importlib.reload(utils)
+    utils.load_key.cache_clear()
+    assert utils.decrypt(token) == "hello-world"
     assert key_path.read_bytes() == key_bytes
-    assert module.decrypt(token) == "hello-world"
 
 
-def test_short_token_key_file_rejected(tmp_path, monkeypatch) -> None:
+def test_short_token_key_file_rejected(tmp_path) -> None:
     key_path = tmp_path / "short.key"
     key_path.write_bytes(b"too-short")
-    monkeypatch.setenv("DLHD_PROXY_KEY_FILE", str(key_path))
     with pytest.raises(RuntimeError):
-        importlib.reload(utils)
+        utils.load_key(str(key_path))